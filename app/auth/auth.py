@@ -1,15 +1,19 @@
 import os
-from datetime import datetime, timedelta
+import uuid
+from datetime import datetime, timedelta, timezone
 from typing import Annotated
 
 from database import get_db
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, HTTPException
+from auth.throttling import (login_ip_limiter, login_mail_ip_limiter,
+                             login_mail_limiter)
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from models.clients import Client
+from models.clients import Client, RefreshToken
 from passlib.context import CryptContext
-from schemas.client import Token
+from schemas.client import RefreshRequest, Token
 from sqlalchemy.orm import Session
 from starlette import status
 
@@ -17,6 +21,8 @@ load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 20))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
 
 router = APIRouter()
 
@@ -30,19 +36,165 @@ db_dependency = Annotated[Session, Depends(get_db)]
 @router.post("/token", response_model=Token, tags=["Authentication"])
 async def login(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: db_dependency
+    db: db_dependency,
+    request: Request,
 ):
     """
     Аутентификация и получение токена.
+
+    Число попыток входа с одного IP адреса ограничено. Неудачные попытки
+    ограничены для почты (с большим запасом, чтобы чужие ошибки не сразу
+    блокировали вход владельцу) и для пары почта и IP. Попытка списывается
+    до проверки пароля и возвращается при успешном входе, поэтому
+    параллельные запросы не проверят больше паролей, чем осталось попыток.
     """
-    user = authenticate_user(form_data.username, form_data.password, db)
+    ip = request.client.host if request.client else ""
+    too_many_attempts(login_ip_limiter.consume(ip))
+    reserved = []
+    for limiter, key in (
+        (login_mail_limiter, form_data.username),
+        (login_mail_ip_limiter, f"{form_data.username}|{ip}"),
+    ):
+        retry_after = limiter.consume(key)
+        if retry_after:
+            for reserved_limiter, reserved_key in reserved:
+                reserved_limiter.refund(reserved_key)
+            too_many_attempts(retry_after)
+        reserved.append((limiter, key))
+    user = await run_in_threadpool(
+        authenticate_user, form_data.username, form_data.password, db
+    )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Вы ввели неверные данные"
         )
-    token = create_access_token(user.mail, user.id, timedelta(minutes=20))
-    return {"access_token": token, "token_type": "bearer"}
+    for limiter, key in reserved:
+        limiter.refund(key)
+    return issue_tokens(user.mail, user.id, str(uuid.uuid4()), db)
+
+
+@router.post("/refresh", response_model=Token, tags=["Authentication"])
+async def refresh(data: RefreshRequest, db: db_dependency):
+    """
+    Обновление токена доступа по refresh токену без ввода пароля.
+
+    Refresh токен одноразовый: в ответе выдаётся новый. Повторное
+    использование старого токена отзывает все токены этого входа.
+    """
+    payload = decode_refresh_token(data.refresh_token)
+    token = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.jti == payload["jti"])
+        .first()
+    )
+    if token is None:
+        raise_unauthorized()
+    # Условное обновление: из двух одновременных обменов одного токена
+    # успешен только один, второй считается повторным использованием.
+    rotated = (
+        db.query(RefreshToken)
+        .filter(
+            RefreshToken.jti == payload["jti"],
+            RefreshToken.revoked.is_(False),
+        )
+        .update({RefreshToken.revoked: True}, synchronize_session=False)
+    )
+    if not rotated:
+        revoke_family(token.family, db)
+        raise_unauthorized()
+    client = db.query(Client).filter(Client.id == token.client_id).first()
+    if client is None:
+        db.commit()
+        raise_unauthorized()
+    return issue_tokens(client.mail, client.id, token.family, db)
+
+
+@router.post("/revoke", tags=["Authentication"])
+async def revoke(data: RefreshRequest, db: db_dependency):
+    """
+    Отзыв refresh токена и всех токенов, выданных вместе с ним.
+    """
+    payload = decode_refresh_token(data.refresh_token)
+    token = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.jti == payload["jti"])
+        .first()
+    )
+    if token is not None:
+        revoke_family(token.family, db)
+    return {"message": "Токен отозван."}
+
+
+def too_many_attempts(retry_after: float):
+    """
+    Отклоняет попытку входа, если лимит исчерпан (`retry_after` > 0).
+    """
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Слишком много попыток входа, повторите позже",
+            headers={"Retry-After": str(int(retry_after) + 1)},
+        )
+
+
+def raise_unauthorized():
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Пользователь не прошёл проверку",
+    )
+
+
+def issue_tokens(mail: str, user_id: int, family: str, db):
+    """
+    Выдаёт токен доступа и новый refresh токен из семейства `family`.
+    """
+    access_token = create_access_token(
+        mail, user_id, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    jti = uuid.uuid4().hex
+    expires = datetime.now(timezone.utc) + timedelta(
+        days=REFRESH_TOKEN_EXPIRE_DAYS
+    )
+    db.add(
+        RefreshToken(
+            jti=jti, family=family, client_id=user_id, expires_at=expires
+        )
+    )
+    db.commit()
+    refresh_token = jwt.encode(
+        {"sub": mail, "jti": jti, "type": "refresh", "exp": expires},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+    }
+
+
+def decode_refresh_token(refresh_token: str):
+    """
+    Проверяет подпись и срок действия refresh токена.
+    """
+    try:
+        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=ALGORITHM)
+    except JWTError:
+        raise_unauthorized()
+    if payload.get("type") != "refresh" or not payload.get("jti"):
+        raise_unauthorized()
+    return payload
+
+
+def revoke_family(family: str, db):
+    """
+    Отзывает все refresh токены семейства.
+    """
+    db.query(RefreshToken).filter(RefreshToken.family == family).update(
+        {RefreshToken.revoked: True}, synchronize_session=False
+    )
+    db.commit()
 
 
 def authenticate_user(mail: str, password: str, db):
@@ -62,7 +214,7 @@ def create_access_token(mail: str, user_id: int, expires_delta: timedelta):
     Создает JWT токен доступа с указанным сроком действия.
     """
     encode = {"sub": mail, "id": user_id}
-    expires = datetime.now() + expires_delta
+    expires = datetime.now(timezone.utc) + expires_delta
     encode.update({"exp": expires})
     return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+import zlib
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+LOGIN_MAIL_BURST = int(os.getenv("LOGIN_MAIL_BURST", 30))
+LOGIN_MAIL_PER_MINUTE = float(os.getenv("LOGIN_MAIL_PER_MINUTE", 10))
+LOGIN_MAIL_IP_BURST = int(os.getenv("LOGIN_MAIL_IP_BURST", 5))
+LOGIN_MAIL_IP_PER_MINUTE = float(os.getenv("LOGIN_MAIL_IP_PER_MINUTE", 5))
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", 20))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", 20))
+
+
+class TokenBucketLimiter:
+    """
+    Ограничитель частоты запросов по алгоритму token bucket.
+
+    У каждого ключа своё ведро на `burst` попыток, которое пополняется
+    со скоростью `per_minute` попыток в минуту. Ключи разложены по
+    `shards` независимым словарям со своими блокировками, чтобы потоки
+    не ждали друг друга. Полностью пополнившиеся вёдра удаляются, когда
+    шард разрастается больше `shard_size` ключей.
+    """
+
+    def __init__(
+        self,
+        burst: int,
+        per_minute: float,
+        shards: int = 16,
+        shard_size: int = 10000,
+    ):
+        self.burst = burst
+        self.rate = per_minute / 60
+        self.shard_size = shard_size
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, key: str):
+        return self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+
+    def consume(self, key: str):
+        """
+        Списывает попытку. Возвращает 0, если попытка разрешена, иначе
+        число секунд до появления следующей.
+        """
+        buckets, lock = self._shard(key)
+        now = time.monotonic()
+        with lock:
+            tokens, updated = buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                buckets[key] = (tokens, now)
+                return (1 - tokens) / self.rate if self.rate else 60.0
+            buckets[key] = (tokens - 1, now)
+            if len(buckets) > self.shard_size:
+                self._prune(buckets, now)
+        return 0
+
+    def refund(self, key: str):
+        """
+        Возвращает ранее списанную попытку.
+        """
+        buckets, lock = self._shard(key)
+        now = time.monotonic()
+        with lock:
+            tokens, updated = buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate + 1)
+            buckets[key] = (tokens, now)
+
+    def _prune(self, buckets: dict, now: float):
+        for key, (tokens, updated) in list(buckets.items()):
+            if tokens + (now - updated) * self.rate >= self.burst:
+                del buckets[key]
+
+
+login_mail_limiter = TokenBucketLimiter(
+    LOGIN_MAIL_BURST, LOGIN_MAIL_PER_MINUTE
+)
+login_mail_ip_limiter = TokenBucketLimiter(
+    LOGIN_MAIL_IP_BURST, LOGIN_MAIL_IP_PER_MINUTE
+)
+login_ip_limiter = TokenBucketLimiter(LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE)
@@ -1,13 +1,28 @@
 from auth import auth as AuthRouter
+from auth.auth import get_current_user
 from database import Base, engine
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.staticfiles import StaticFiles
+from middleware.admission import AdmissionControlMiddleware, admission_stats
 from routers import client as ClientRouter
 
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI()
+app.add_middleware(AdmissionControlMiddleware)
 app.include_router(AuthRouter.router, prefix="/auth")
 app.include_router(ClientRouter.router, prefix="/api")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
+
+
+@app.get(
+    "/admission/stats",
+    tags=["Service"],
+    dependencies=[Depends(get_current_user)],
+)
+async def admission():
+    """
+    Счётчики ограничения нагрузки по маршрутам.
+    """
+    return admission_stats()
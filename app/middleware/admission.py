@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 2))
+ADMISSION_LIMITS = {
+    ("POST", "/auth/token"): (
+        int(os.getenv("ADMISSION_LOGIN_CONCURRENCY", 4)),
+        int(os.getenv("ADMISSION_LOGIN_QUEUE", 16)),
+    ),
+    ("POST", "/api/clients/create"): (
+        int(os.getenv("ADMISSION_CREATE_CONCURRENCY", 4)),
+        int(os.getenv("ADMISSION_CREATE_QUEUE", 16)),
+    ),
+}
+
+
+class RouteLimiter:
+    """
+    Ограничение числа одновременных запросов к маршруту.
+
+    Запросы сверх `concurrency` ждут в очереди длиной не более `queue`
+    не дольше `timeout` секунд; остальные сразу получают отказ.
+    """
+
+    def __init__(self, concurrency: int, queue: int, timeout: float):
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def acquire(self):
+        """
+        Занимает место для запроса. Возвращает False при отказе.
+        """
+        if self.queued >= self.queue and self._semaphore.locked():
+            self.rejected += 1
+            return False
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware, ограничивающее параллелизм тяжёлых маршрутов.
+
+    Если очередь маршрута заполнена или ожидание в ней превысило таймаут,
+    запрос сразу завершается ответом 503 с заголовком `Retry-After`,
+    не занимая CPU, и остальные маршруты продолжают отвечать.
+    """
+
+    def __init__(
+        self,
+        app,
+        limits: dict = ADMISSION_LIMITS,
+        timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.app = app
+        self.limiters = {
+            route: RouteLimiter(concurrency, queue, timeout)
+            for route, (concurrency, queue) in limits.items()
+        }
+        admission_limiters.update(self.limiters)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limiter = self.limiters.get((scope["method"], scope["path"]))
+        if limiter is None:
+            return await self.app(scope, receive, send)
+        if not await limiter.acquire():
+            return await self.reject(send)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+    @staticmethod
+    async def reject(send):
+        body = json.dumps(
+            {"detail": "Сервер перегружен, повторите запрос позже"},
+            ensure_ascii=False,
+        ).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", b"1"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+admission_limiters = {}
+
+
+def admission_stats():
+    """
+    Возвращает счётчики middleware по каждому ограниченному маршруту.
+    """
+    return {
+        f"{method} {path}": limiter.stats()
+        for (method, path), limiter in admission_limiters.items()
+    }
@@ -0,0 +1,40 @@
+"""mutual matches unique
+
+Revision ID: 1631069a9892
+Revises: 95aa31a4a584
+Create Date: 2026-10-19 15:31:08.227164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1631069a9892'
+down_revision: Union[str, None] = '95aa31a4a584'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Убираем дубли пар, которые могла вставить первая версия заполнения.
+    op.execute(
+        "DELETE FROM mutual_matches WHERE id NOT IN "
+        "(SELECT MIN(id) FROM mutual_matches GROUP BY client_id, partner_id)"
+    )
+    with op.batch_alter_table('mutual_matches') as batch_op:
+        batch_op.create_unique_constraint(
+            'uq_mutual_matches_client_id_partner_id',
+            ['client_id', 'partner_id'],
+        )
+    op.create_index(op.f('ix_mutual_matches_partner_id'), 'mutual_matches', ['partner_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_mutual_matches_partner_id'), table_name='mutual_matches')
+    with op.batch_alter_table('mutual_matches') as batch_op:
+        batch_op.drop_constraint(
+            'uq_mutual_matches_client_id_partner_id', type_='unique'
+        )
@@ -0,0 +1,45 @@
+"""mutual matches
+
+Revision ID: 2fe4e111f4a0
+Revises: 07850152e47b
+Create Date: 2026-10-19 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2fe4e111f4a0'
+down_revision: Union[str, None] = '07850152e47b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('mutual_matches',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('client_id', sa.Integer(), nullable=False),
+    sa.Column('partner_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_mutual_matches_id'), 'mutual_matches', ['id'], unique=False)
+    op.create_index(op.f('ix_mutual_matches_client_id'), 'mutual_matches', ['client_id'], unique=False)
+    # Заполняем список смежности по уже существующим взаимным голосам;
+    # повторные голоса пары дают одну строку.
+    op.execute(
+        "INSERT INTO mutual_matches (client_id, partner_id, date) "
+        "SELECT a.matcher, a.matched, MAX(MIN(a.date), MIN(b.date)) "
+        "FROM matches a JOIN matches b "
+        "ON a.matcher = b.matched AND a.matched = b.matcher "
+        "GROUP BY a.matcher, a.matched"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_mutual_matches_client_id'), table_name='mutual_matches')
+    op.drop_index(op.f('ix_mutual_matches_id'), table_name='mutual_matches')
+    op.drop_table('mutual_matches')
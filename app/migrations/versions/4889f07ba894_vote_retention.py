@@ -0,0 +1,54 @@
+"""vote retention
+
+Revision ID: 4889f07ba894
+Revises: 2fe4e111f4a0
+Create Date: 2026-10-19 11:04:52.771530
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4889f07ba894'
+down_revision: Union[str, None] = '2fe4e111f4a0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_matches_matcher_date', 'matches', ['matcher', 'date'], unique=False)
+    op.create_table('vote_states',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('matcher', sa.Integer(), nullable=False),
+    sa.Column('matched', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('matcher', 'matched')
+    )
+    op.create_index(op.f('ix_vote_states_id'), 'vote_states', ['id'], unique=False)
+    op.create_index(op.f('ix_vote_states_matched'), 'vote_states', ['matched'], unique=False)
+    op.create_index(op.f('ix_vote_states_matcher'), 'vote_states', ['matcher'], unique=False)
+    op.create_table('vote_daily_counts',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('matcher', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('matcher', 'date')
+    )
+    op.create_index(op.f('ix_vote_daily_counts_id'), 'vote_daily_counts', ['id'], unique=False)
+    op.create_index(op.f('ix_vote_daily_counts_matcher'), 'vote_daily_counts', ['matcher'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_vote_daily_counts_matcher'), table_name='vote_daily_counts')
+    op.drop_index(op.f('ix_vote_daily_counts_id'), table_name='vote_daily_counts')
+    op.drop_table('vote_daily_counts')
+    op.drop_index(op.f('ix_vote_states_matcher'), table_name='vote_states')
+    op.drop_index(op.f('ix_vote_states_matched'), table_name='vote_states')
+    op.drop_index(op.f('ix_vote_states_id'), table_name='vote_states')
+    op.drop_table('vote_states')
+    op.drop_index('ix_matches_matcher_date', table_name='matches')
@@ -0,0 +1,53 @@
+"""clients autoincrement
+
+Revision ID: 95aa31a4a584
+Revises: d1d66de412b2
+Create Date: 2026-10-19 15:02:17.604391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '95aa31a4a584'
+down_revision: Union[str, None] = 'd1d66de412b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Без AUTOINCREMENT SQLite отдаёт новому клиенту id последнего
+    # удалённого, и тот наследует его ETag и токены.
+    with op.batch_alter_table(
+        'clients',
+        recreate='always',
+        table_kwargs={'sqlite_autoincrement': True},
+    ):
+        pass
+    # id удалённых ранее клиентов, на которые ещё ссылаются голоса и
+    # refresh токены, тоже не должны выдаваться повторно.
+    op.execute(
+        "INSERT INTO sqlite_sequence (name, seq) "
+        "SELECT 'clients', 0 WHERE NOT EXISTS "
+        "(SELECT 1 FROM sqlite_sequence WHERE name = 'clients')"
+    )
+    op.execute(
+        "UPDATE sqlite_sequence SET seq = MAX(seq, "
+        "(SELECT COALESCE(MAX(id), 0) FROM clients), "
+        "(SELECT COALESCE(MAX(matcher), 0) FROM matches), "
+        "(SELECT COALESCE(MAX(matched), 0) FROM matches), "
+        "(SELECT COALESCE(MAX(client_id), 0) FROM refresh_tokens)) "
+        "WHERE name = 'clients'"
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table(
+        'clients',
+        recreate='always',
+        table_kwargs={'sqlite_autoincrement': False},
+    ):
+        pass
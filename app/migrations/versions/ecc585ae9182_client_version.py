@@ -0,0 +1,27 @@
+"""client version
+
+Revision ID: ecc585ae9182
+Revises: 4889f07ba894
+Create Date: 2026-10-19 12:27:09.504117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ecc585ae9182'
+down_revision: Union[str, None] = '4889f07ba894'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('clients', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('clients') as batch_op:
+        batch_op.drop_column('version')
@@ -1,12 +1,17 @@
 from database import Base
-from sqlalchemy import Column, Date, Float, Integer, String, func
+from sqlalchemy import (Boolean, Column, Date, DateTime, Float, Index, Integer,
+                        String, UniqueConstraint, func)
 
 
 class Client(Base):
     """
     Модель таблицы `clients` для хранения информации о клиентах.
+
+    id не переиспользуются (AUTOINCREMENT): ETag профиля и токены
+    удалённого клиента не достаются новому.
     """
     __tablename__ = "clients"
+    __table_args__ = {"sqlite_autoincrement": True}
 
     id = Column(Integer, primary_key=True, index=True)
     mail = Column(String, unique=True, nullable=False, index=True)
@@ -18,6 +23,7 @@ class Client(Base):
     latitude = Column(Float, nullable=True)
     longitude = Column(Float, nullable=True)
     registration_date = Column(Date, default=func.current_date())
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
 
 class Match(Base):
@@ -25,8 +31,73 @@ class Match(Base):
     Модель таблицы `matches` для хранения информации голосовании.
     """
     __tablename__ = "matches"
+    __table_args__ = (Index("ix_matches_matcher_date", "matcher", "date"),)
 
     id = Column(Integer, primary_key=True, index=True)
     matcher = Column(Integer, index=True)
     matched = Column(Integer, index=True)
     date = Column(Date, default=func.current_date())
+
+
+class MutualMatch(Base):
+    """
+    Модель таблицы `mutual_matches` - список смежности взаимных симпатий.
+
+    Для каждой пары хранится две строки (по одной на каждого участника),
+    поэтому список взаимных симпатий клиента читается по индексу
+    `client_id` без соединения таблицы `matches` самой с собой.
+    """
+    __tablename__ = "mutual_matches"
+    __table_args__ = (UniqueConstraint("client_id", "partner_id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, nullable=False, index=True)
+    partner_id = Column(Integer, nullable=False, index=True)
+    date = Column(Date, default=func.current_date())
+
+
+class VoteState(Base):
+    """
+    Модель таблицы `vote_states` - сжатое состояние голосов по парам.
+
+    Сюда переносятся исторические голоса из `matches` при очистке:
+    одна строка на пару (кто голосовал, за кого) с датой голоса.
+    """
+    __tablename__ = "vote_states"
+    __table_args__ = (UniqueConstraint("matcher", "matched"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    matcher = Column(Integer, nullable=False, index=True)
+    matched = Column(Integer, nullable=False, index=True)
+    date = Column(Date)
+
+
+class VoteDailyCount(Base):
+    """
+    Модель таблицы `vote_daily_counts` - сводка голосов клиента по дням.
+    """
+    __tablename__ = "vote_daily_counts"
+    __table_args__ = (UniqueConstraint("matcher", "date"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    matcher = Column(Integer, nullable=False, index=True)
+    date = Column(Date, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class RefreshToken(Base):
+    """
+    Модель таблицы `refresh_tokens` для хранения выданных refresh токенов.
+
+    Все токены, полученные ротацией из одного входа, относятся к одному
+    семейству `family`. Повторное использование уже обменянного токена
+    отзывает всё семейство.
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String, unique=True, nullable=False, index=True)
+    family = Column(String, nullable=False, index=True)
+    client_id = Column(Integer, nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False)
+    revoked = Column(Boolean, nullable=False, default=False)
@@ -3,8 +3,10 @@ from typing import Annotated, Optional, Union
 
 from auth.auth import get_current_user
 from database import get_db
-from fastapi import (APIRouter, BackgroundTasks, Depends, File, HTTPException,
-                     UploadFile)
+from fastapi import (APIRouter, BackgroundTasks, Depends, File, Header,
+                     HTTPException, Response, UploadFile)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from schemas import client as ClientSchemas
 from services import client as ClientService
 from sqlalchemy.orm import Session
@@ -28,14 +30,113 @@ async def create(
     - `data`: Данные клиента (имя, фамилия, почта, и т. д.)
     - `profile_pic`: Файл изображения профиля клиента
     """
-    return ClientService.create_client(data, db, profile_pic, background_tasks)
+    return await run_in_threadpool(
+        ClientService.create_client, data, db, profile_pic, background_tasks
+    )
+
+
+@router.get("/clients/me/matches", tags=["Match"])
+async def my_matches(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Получить список клиентов со взаимной симпатией.
+    """
+    return ClientService.get_mutual_matches(current_user["id"], db)
+
+
+@router.get("/clients/me/votes/received", tags=["Match"])
+async def my_votes_received(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Получить список клиентов, проголосовавших за текущего пользователя.
+    """
+    return ClientService.get_votes_received(current_user["id"], db)
+
+
+@router.get("/clients/me/votes/given", tags=["Match"])
+async def my_votes_given(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Получить список клиентов, за которых голосовал текущий пользователь.
+    """
+    return ClientService.get_votes_given(current_user["id"], db)
+
+
+@router.get("/clients/export", tags=["Client"])
+def export_clients(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+    sex: Optional[str] = None,
+    name: Optional[str] = None,
+    last_name: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    distance: Optional[int] = None,
+    sort_by: Optional[str] = None,
+    compress: bool = False,
+):
+    """
+    Выгрузить список клиентов в формате NDJSON (по клиенту на строку).
+
+    **Параметры**:
+    - фильтры те же, что и у получения списка клиентов
+    - `compress`: Сжать выгрузку gzip (опционально)
+    """
+    longitude, latitude = None, None
+    if current_user and distance is not None:
+        user = ClientService.get_client(current_user["id"], db)
+        longitude = user.longitude
+        latitude = user.latitude
+    rows = ClientService.export_clients(
+        sex,
+        name,
+        last_name,
+        start_date,
+        end_date,
+        distance,
+        longitude,
+        latitude,
+        sort_by,
+        compress,
+    )
+    if compress:
+        return StreamingResponse(
+            rows,
+            media_type="application/gzip",
+            headers={
+                "Content-Disposition": (
+                    'attachment; filename="clients.ndjson.gz"'
+                )
+            },
+        )
+    return StreamingResponse(rows, media_type="application/x-ndjson")
 
 
 @router.get("/clients/{id}", tags=["Client"])
-async def get(id: int, db: Session = Depends(get_db)):
+async def get(
+    id: int,
+    response: Response,
+    db: Session = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+):
     """
     Получить информацию о клиенте по ID.
+
+    Ответ содержит заголовок `ETag`; при совпадении с `If-None-Match`
+    возвращается `304 Not Modified` без тела.
     """
+    etag = ClientService.get_client_etag(id, db)
+    if ClientService.etag_matches(if_none_match, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    response.headers["ETag"] = etag
     return ClientService.get_client(id, db)
 
 
@@ -65,6 +166,48 @@ async def update(
     return ClientService.update(profile_pic, id, data, db, background_tasks)
 
 
+@router.patch("/clients/{id}", tags=["Client"])
+async def patch(
+    id: int,
+    data: ClientSchemas.ClientUpdate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Частично обновить данные клиента.
+
+    **Тело запроса** (JSON): только изменяемые поля клиента.
+    """
+    if id != current_user["id"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Не разрешено обновлять этого клиента",
+        )
+    return ClientService.patch_client(
+        id, data.model_dump(exclude_unset=True, exclude_none=True), db
+    )
+
+
+@router.patch("/clients/{id}/location", tags=["Client"])
+async def patch_location(
+    id: int,
+    data: ClientSchemas.ClientLocation,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Обновить местоположение клиента.
+
+    **Тело запроса** (JSON): `latitude`, `longitude`.
+    """
+    if id != current_user["id"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Не разрешено обновлять этого клиента",
+        )
+    return ClientService.patch_client(id, data.model_dump(), db)
+
+
 @router.delete("/clients/{id}", tags=["Client"])
 async def delete(
     id: int,
@@ -94,6 +237,7 @@ def get_clients(
     end_date: Optional[date] = None,
     distance: Optional[int] = None,
     sort_by: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
 ):
     """
     Получить список клиентов.
@@ -105,6 +249,9 @@ def get_clients(
     - `start_date`, `end_date`: Фильтр по дате регистрации
     - `distance`: Фильтр поиска по расстоянию до клиента
     - `sort_by`: Параметр для сортировки списка клиентов
+
+    Ответ содержит заголовок `ETag`; при совпадении с `If-None-Match`
+    возвращается `304 Not Modified` без тела.
     """
     longitude, latitude = None, None
     if current_user and distance is not None:
@@ -112,7 +259,7 @@ def get_clients(
         longitude = user.longitude
         latitude = user.latitude
 
-    return ClientService.get_all_clients(
+    content, etag = ClientService.get_all_clients_json(
         db,
         sex,
         name,
@@ -123,6 +270,14 @@ def get_clients(
         longitude,
         latitude,
         sort_by,
+        if_none_match,
+    )
+    if content is None:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    return Response(
+        content=content, media_type="application/json", headers={"ETag": etag}
     )
 
 
@@ -125,6 +125,18 @@ class ClientUpdate(BaseModel):
         )
 
 
+class ClientLocation(BaseModel):
+    """
+    Модель данных для обновления местоположения клиента.
+
+    Атрибуты:
+    - latitude (float): Широта местоположения клиента.
+    - longitude (float): Долгота местоположения клиента.
+    """
+    latitude: float
+    longitude: float
+
+
 class Token(BaseModel):
     """
     Модель данных для токена аутентификации.
@@ -132,6 +144,18 @@ class Token(BaseModel):
     Атрибуты:
     - access_token (str): Токен доступа.
     - token_type (str): Тип токена.
+    - refresh_token (Optional[str]): Токен для обновления токена доступа.
     """
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    """
+    Модель данных для обновления или отзыва токена.
+
+    Атрибуты:
+    - refresh_token (str): Выданный ранее refresh токен.
+    """
+    refresh_token: str
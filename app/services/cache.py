@@ -0,0 +1,108 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+CLIENTS_CACHE_SIZE = int(os.getenv("CLIENTS_CACHE_SIZE", 256))
+CLIENTS_CACHE_TTL = float(os.getenv("CLIENTS_CACHE_TTL", 30))
+CLIENTS_CACHE_MAX_BYTES = int(os.getenv("CLIENTS_CACHE_MAX_BYTES", 64 << 20))
+LOCATION_CELL_SIZE = float(os.getenv("LOCATION_CELL_SIZE", 0.01))
+LOCATION_CELL_FRACTION = float(os.getenv("LOCATION_CELL_FRACTION", 0.02))
+# Длина одного градуса широты, км (радиус Земли 6371 км).
+KM_PER_DEGREE = 6371.0 * math.pi / 180
+
+
+class ResponseCache:
+    """
+    LRU кэш готовых ответов, сбрасываемый по номеру поколения данных.
+
+    Каждая запись хранится вместе с поколением, в котором была вычислена.
+    `bump` увеличивает поколение и очищает кэш, поэтому ответ, посчитанный
+    до изменения данных, в кэш уже не попадёт. Время жизни записи
+    ограничено `ttl` секундами: поколение у каждого воркера своё, и TTL
+    ограничивает устаревание данных, изменённых другим воркером.
+    Размер кэша ограничен и числом записей `maxsize`, и суммарным объёмом
+    ответов `maxbytes`: старые записи вытесняются, пока оба ограничения
+    не выполнятся, а ответ больше `maxbytes` не кэшируется вовсе.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, maxbytes: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.generation = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            generation, expires, size, value = entry
+            if generation != self.generation or expires < time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, generation: int, size: int):
+        with self._lock:
+            if (
+                generation != self.generation
+                or self.maxsize <= 0
+                or size > self.maxbytes
+            ):
+                return
+            self._pop(key)
+            self._entries[key] = (
+                generation, time.monotonic() + self.ttl, size, value
+            )
+            self.size += size
+            while (
+                len(self._entries) > self.maxsize or self.size > self.maxbytes
+            ):
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def bump(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self.size = 0
+
+
+clients_cache = ResponseCache(
+    CLIENTS_CACHE_SIZE, CLIENTS_CACHE_TTL, CLIENTS_CACHE_MAX_BYTES
+)
+
+
+def location_cell(latitude: float, longitude: float, distance: float):
+    """
+    Округляет координаты до центра ячейки сетки для поиска по расстоянию.
+
+    Размер ячейки - LOCATION_CELL_FRACTION от радиуса поиска `distance`
+    (км), но не больше LOCATION_CELL_SIZE градусов: сдвиг точки поиска
+    к центру ячейки не превышает примерно 0.7 этой доли радиуса. Для
+    нулевого радиуса координаты возвращаются без изменений.
+    """
+    cell_size = min(
+        LOCATION_CELL_SIZE, LOCATION_CELL_FRACTION * distance / KM_PER_DEGREE
+    )
+    if cell_size <= 0:
+        return latitude, longitude
+    return tuple(
+        round((math.floor(value / cell_size) + 0.5) * cell_size, 9)
+        for value in (latitude, longitude)
+    )
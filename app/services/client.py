@@ -1,17 +1,24 @@
+import hashlib
 import math
 import os
 import shutil
 import uuid
+import zlib
 from datetime import date
 from functools import lru_cache
 
+from database import SessionLocal
 from dotenv import load_dotenv
 from fastapi import BackgroundTasks, HTTPException, UploadFile
-from models.clients import Client, Match
+from models.clients import (Client, Match, MutualMatch, RefreshToken,
+                            VoteState)
 from passlib.context import CryptContext
 from PIL import Image
+from pydantic import TypeAdapter
 from schemas import client as ClientSchemas
-from sqlalchemy import and_
+from services.cache import clients_cache, location_cell
+from services.geo_snapshot import geo_snapshot, record_delete, record_upsert
+from sqlalchemy import and_, or_, update as sql_update
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
@@ -19,8 +26,11 @@ load_dotenv()
 
 
 LIMIT_PER_DAY = int(os.getenv("LIMIT_PER_DAY"))
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 500))
+GEO_SNAPSHOT_MAX_IDS = int(os.getenv("GEO_SNAPSHOT_MAX_IDS", 10000))
 
 bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+clients_list_adapter = TypeAdapter(list[ClientSchemas.ClientResponse])
 
 
 def add_watermark(image_path: str, watermark_path: str):
@@ -63,6 +73,14 @@ def create_client(
         db.add(client)
         db.commit()
         db.refresh(client)
+        clients_cache.bump()
+        record_upsert(
+            client.id,
+            client.latitude,
+            client.longitude,
+            client.sex,
+            client.registration_date,
+        )
     except Exception as e:
         print("Ошибка добавления клиента:", e)
         raise e
@@ -81,6 +99,35 @@ def get_client(id: int, db):
     return ClientSchemas.ClientResponse.model_validate(client)
 
 
+def client_etag(id: int, version: int):
+    """
+    Формирует ETag профиля клиента по его ID и номеру версии.
+    """
+    return f'"{id}-{version}"'
+
+
+def get_client_etag(id: int, db):
+    """
+    Получает ETag клиента, не загружая строку целиком.
+    """
+    version = db.query(Client.version).filter(Client.id == id).scalar()
+    if version is None:
+        raise HTTPException(
+            status_code=404, detail=f"Клиент с id {id} не найден в системе"
+        )
+    return client_etag(id, version)
+
+
+def etag_matches(if_none_match: str, etag: str):
+    """
+    Проверяет, совпадает ли ETag с одним из значений заголовка If-None-Match.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [tag.removeprefix("W/") for tag in tags]
+
+
 @lru_cache(maxsize=1000)
 def great_circle_distance(lat1, lon1, lat2, lon2):
     """
@@ -107,20 +154,17 @@ def great_circle_distance(lat1, lon1, lat2, lon2):
     return distance
 
 
-def get_all_clients(
+def clients_query(
     db,
     sex: str = None,
     name: str = None,
     last_name: str = None,
     start_date: date = None,
     end_date: date = None,
-    distance: int = None,
-    longitude: float = None,
-    latitude: float = None,
     sort_by: str = None,
 ):
     """
-    Получает всех клиентов с возможностью фильтрации и сортировки.
+    Строит запрос клиентов с фильтрацией и сортировкой.
     """
     query = db.query(Client)
     if sex:
@@ -135,25 +179,216 @@ def get_all_clients(
         query = query.filter(Client.registration_date <= end_date)
     if sort_by == "registration_date":
         query = query.order_by(Client.registration_date)
-    if distance is not None and longitude is not None and latitude is not None:
-        filtered_clients = []
-        for user in query:
-            if (
-                great_circle_distance(
-                    latitude, longitude, user.latitude, user.longitude
-                )
-                < distance
-            ):
-                filtered_clients.append(
-                    ClientSchemas.ClientResponse.model_validate(user)
-                )
-        return filtered_clients
+    return query
+
+
+def get_all_clients(
+    db,
+    sex: str = None,
+    name: str = None,
+    last_name: str = None,
+    start_date: date = None,
+    end_date: date = None,
+    distance: int = None,
+    longitude: float = None,
+    latitude: float = None,
+    sort_by: str = None,
+):
+    """
+    Получает всех клиентов с возможностью фильтрации и сортировки.
+    """
+    query = clients_query(
+        db, sex, name, last_name, start_date, end_date, sort_by
+    )
+    query = distance_query(
+        query, distance, longitude, latitude, sex, start_date, end_date
+    )
     return [
         ClientSchemas.ClientResponse.model_validate(client)
-        for client in query.all()
+        for client in within_distance(query, distance, longitude, latitude)
     ]
 
 
+def distance_query(
+    query,
+    distance: int = None,
+    longitude: float = None,
+    latitude: float = None,
+    sex: str = None,
+    start_date: date = None,
+    end_date: date = None,
+):
+    """
+    Сужает запрос клиентов до найденных по снимку координат.
+
+    Клиенты рядом с точкой ищутся в общем для воркеров снимке, и база
+    читает только их строки. Если снимок не собран или кандидатов больше
+    GEO_SNAPSHOT_MAX_IDS, запрос возвращается без изменений.
+    """
+    if distance is None or longitude is None or latitude is None:
+        return query
+    candidates = geo_snapshot.candidates(
+        latitude, longitude, distance, sex, start_date, end_date
+    )
+    if candidates is None or len(candidates) > GEO_SNAPSHOT_MAX_IDS:
+        return query
+    ids = [
+        candidate.id
+        for candidate in within_distance(
+            candidates, distance, longitude, latitude
+        )
+    ]
+    return query.filter(Client.id.in_(ids))
+
+
+def within_distance(
+    rows, distance: int = None, longitude: float = None, latitude: float = None
+):
+    """
+    Оставляет строки клиентов, находящихся ближе `distance` км от точки.
+
+    Если расстояние или координаты не заданы, строки не фильтруются.
+    """
+    if distance is None or longitude is None or latitude is None:
+        yield from rows
+        return
+    for row in rows:
+        if (
+            great_circle_distance(
+                latitude, longitude, row.latitude, row.longitude
+            )
+            < distance
+        ):
+            yield row
+
+
+def get_clients_etag(
+    db,
+    sex: str = None,
+    name: str = None,
+    last_name: str = None,
+    start_date: date = None,
+    end_date: date = None,
+    distance: int = None,
+    longitude: float = None,
+    latitude: float = None,
+    sort_by: str = None,
+):
+    """
+    Вычисляет ETag списка клиентов по ID и версиям строк выборки.
+
+    Запрос читает только ID, версии и координаты, без полных строк.
+    """
+    query = clients_query(
+        db, sex, name, last_name, start_date, end_date, sort_by
+    ).with_entities(
+        Client.id, Client.version, Client.latitude, Client.longitude
+    )
+    query = distance_query(
+        query, distance, longitude, latitude, sex, start_date, end_date
+    )
+    digest = hashlib.blake2b(digest_size=16)
+    for row in within_distance(query, distance, longitude, latitude):
+        digest.update(f"{row.id}:{row.version},".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def export_clients(
+    sex: str = None,
+    name: str = None,
+    last_name: str = None,
+    start_date: date = None,
+    end_date: date = None,
+    distance: int = None,
+    longitude: float = None,
+    latitude: float = None,
+    sort_by: str = None,
+    compress: bool = False,
+):
+    """
+    Построчно выгружает клиентов в формате NDJSON.
+
+    Строки читаются из базы пачками по EXPORT_BATCH_SIZE (`yield_per`),
+    поэтому расход памяти не зависит от размера таблицы. Генератор
+    открывает собственную сессию: ответ отдаётся уже после того, как
+    сессия из `get_db` закрыта.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    db = SessionLocal()
+    try:
+        query = clients_query(
+            db, sex, name, last_name, start_date, end_date, sort_by
+        )
+        query = distance_query(
+            query, distance, longitude, latitude, sex, start_date, end_date
+        ).yield_per(EXPORT_BATCH_SIZE)
+        for client in within_distance(query, distance, longitude, latitude):
+            line = ClientSchemas.ClientResponse.model_validate(
+                client
+            ).model_dump_json().encode() + b"\n"
+            if compressor:
+                line = compressor.compress(line)
+                if not line:
+                    continue
+            yield line
+        if compressor:
+            yield compressor.flush()
+    finally:
+        db.close()
+
+
+def get_all_clients_json(
+    db,
+    sex: str = None,
+    name: str = None,
+    last_name: str = None,
+    start_date: date = None,
+    end_date: date = None,
+    distance: int = None,
+    longitude: float = None,
+    latitude: float = None,
+    sort_by: str = None,
+    if_none_match: str = None,
+):
+    """
+    Возвращает список клиентов в виде готового JSON и его ETag.
+
+    Ключ кэша - нормализованный набор фильтров. Для поиска по расстоянию
+    координаты пользователя заменяются центром ячейки сетки, размер
+    которой пропорционален радиусу, поэтому соседние пользователи
+    получают один и тот же ответ из кэша.
+    Если ETag совпал с `if_none_match`, вместо JSON возвращается None,
+    а полные строки из базы не читаются.
+    """
+    if distance is not None and longitude is not None and latitude is not None:
+        latitude, longitude = location_cell(latitude, longitude, distance)
+    else:
+        distance, longitude, latitude = None, None, None
+    filters = dict(
+        sex=sex or None,
+        name=name or None,
+        last_name=last_name or None,
+        start_date=start_date or None,
+        end_date=end_date or None,
+        distance=distance,
+        longitude=longitude,
+        latitude=latitude,
+        sort_by=sort_by if sort_by == "registration_date" else None,
+    )
+    key = tuple(filters.values())
+    cached = clients_cache.get(key)
+    if cached is not None:
+        content, etag = cached
+        return (None if etag_matches(if_none_match, etag) else content), etag
+    generation = clients_cache.generation
+    etag = get_clients_etag(db, **filters)
+    if etag_matches(if_none_match, etag):
+        return None, etag
+    content = clients_list_adapter.dump_json(get_all_clients(db, **filters))
+    clients_cache.set(key, (content, etag), generation, len(content))
+    return content, etag
+
+
 def update(
     profile_pic: UploadFile,
     id: int,
@@ -171,6 +406,7 @@ def update(
         client.mail = data.mail
     if data.password != "":
         client.hashed_password = bcrypt_context.hash(data.password)
+        revoke_refresh_tokens(id, db)
     if data.name != "":
         client.name = data.name
     if data.last_name != "":
@@ -201,9 +437,18 @@ def update(
         except Exception as e:
             print("Ошибка при сохранении профиля:", e)
             return {"error": "Не удалось сохранить изображение профиля."}
+    client.version = Client.version + 1
     try:
         db.commit()
         db.refresh(client)
+        clients_cache.bump()
+        record_upsert(
+            client.id,
+            client.latitude,
+            client.longitude,
+            client.sex,
+            client.registration_date,
+        )
     except IntegrityError as e:
         db.rollback()
         print("Ошибка обновления клиента:", e)
@@ -211,6 +456,74 @@ def update(
     return ClientSchemas.ClientResponse.model_validate(client)
 
 
+def patch_client(id: int, values: dict, db: Session):
+    """
+    Частично обновляет клиента одним запросом `UPDATE ... RETURNING`.
+
+    Обновляются только переданные поля, строка клиента в сессию
+    не загружается. Пустые строки, как и в `update`, означают, что
+    поле не меняется.
+    """
+    values = {
+        field: value for field, value in values.items() if value != ""
+    }
+    if not values:
+        raise HTTPException(
+            status_code=400, detail="Нет данных для обновления"
+        )
+    if "password" in values:
+        values["hashed_password"] = bcrypt_context.hash(
+            values.pop("password")
+        )
+        revoke_refresh_tokens(id, db)
+    statement = (
+        sql_update(Client)
+        .where(Client.id == id)
+        .values(**values, version=Client.version + 1)
+        .returning(
+            *(
+                getattr(Client, field)
+                for field in ClientSchemas.ClientResponse.model_fields
+            )
+        )
+    )
+    try:
+        row = db.execute(statement).mappings().first()
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        print("Ошибка обновления клиента:", e)
+        raise HTTPException(
+            status_code=400,
+            detail="Произошла ошибка при обновлении клиента.",
+        )
+    if row is None:
+        raise HTTPException(
+            status_code=404, detail=f"Клиент с id {id} не найден в системе"
+        )
+    clients_cache.bump()
+    record_upsert(
+        row["id"],
+        row["latitude"],
+        row["longitude"],
+        row["sex"],
+        row["registration_date"],
+    )
+    return ClientSchemas.ClientResponse.model_validate(dict(row))
+
+
+def revoke_refresh_tokens(client_id: int, db: Session):
+    """
+    Отзывает все refresh токены клиента в текущей транзакции.
+
+    Вызывается при смене пароля и удалении клиента: ID удалённого клиента
+    может достаться новому, и старые токены не должны к нему подходить.
+    """
+    db.query(RefreshToken).filter(RefreshToken.client_id == client_id).update(
+        {RefreshToken.revoked: True}, synchronize_session=False
+    )
+
+
 def remove(id: int, db: Session):
     """
     Удаляет клиента и его фото профиля.
@@ -220,8 +533,22 @@ def remove(id: int, db: Session):
         return {"error": "Клиент не найден."}
     if client.profile_pic and os.path.exists(client.profile_pic):
         os.remove(client.profile_pic)
+    revoke_refresh_tokens(id, db)
+    # Голоса и взаимные симпатии удаляются вместе с клиентом, чтобы
+    # не оставаться в списках его партнёров.
+    db.query(MutualMatch).filter(
+        or_(MutualMatch.client_id == id, MutualMatch.partner_id == id)
+    ).delete(synchronize_session=False)
+    db.query(Match).filter(
+        or_(Match.matcher == id, Match.matched == id)
+    ).delete(synchronize_session=False)
+    db.query(VoteState).filter(
+        or_(VoteState.matcher == id, VoteState.matched == id)
+    ).delete(synchronize_session=False)
     db.delete(client)
     db.commit()
+    clients_cache.bump()
+    record_delete(id)
     return {"message": "Клиент успешно удален."}
 
 
@@ -235,6 +562,32 @@ def send_email_mock(subject: str, body: str, recipient: str):
     print("-" * 50)
 
 
+def has_voted(matcher_id: int, matched_id: int, db: Session):
+    """
+    Проверяет, голосовал ли клиент за другого клиента.
+
+    Свежие голоса лежат в `matches`, исторические - в `vote_states`.
+    """
+    recent_vote = (
+        db.query(Match.id)
+        .filter(and_(Match.matcher == matcher_id, Match.matched == matched_id))
+        .first()
+    )
+    if recent_vote:
+        return True
+    historic_vote = (
+        db.query(VoteState.id)
+        .filter(
+            and_(
+                VoteState.matcher == matcher_id,
+                VoteState.matched == matched_id,
+            )
+        )
+        .first()
+    )
+    return historic_vote is not None
+
+
 def matching(matcher_id: int, matched_id: int, db: Session):
     """
     Обрабатывает голосование за симпатию и проверяет наличие взаимности.
@@ -252,16 +605,8 @@ def matching(matcher_id: int, matched_id: int, db: Session):
                 f"{LIMIT_PER_DAY} оценок в день."
             )
         }
-    matcher_match = (
-        db.query(Match)
-        .filter(and_(Match.matcher == matcher_id, Match.matched == matched_id))
-        .first()
-    )
-    matched_match = (
-        db.query(Match)
-        .filter(and_(Match.matcher == matched_id, Match.matched == matcher_id))
-        .first()
-    )
+    matcher_match = has_voted(matcher_id, matched_id, db)
+    matched_match = has_voted(matched_id, matcher_id, db)
     if matcher_match:
         return {"message": "Вы уже голосовали за этого человека."}
     elif not matcher_match and not matched_match:
@@ -273,6 +618,12 @@ def matching(matcher_id: int, matched_id: int, db: Session):
     else:
         matcher_match = Match(matcher=matcher_id, matched=matched_id)
         db.add(matcher_match)
+        db.add_all(
+            [
+                MutualMatch(client_id=matcher_id, partner_id=matched_id),
+                MutualMatch(client_id=matched_id, partner_id=matcher_id),
+            ]
+        )
         db.commit()
         db.refresh(matcher_match)
         matcher_user = db.query(Client).filter(Client.id == matcher_id).first()
@@ -294,3 +645,59 @@ def matching(matcher_id: int, matched_id: int, db: Session):
                 f"Почта участника: {matched_user.mail}"
             )
         }
+
+
+def _clients_by_ids(ids: list, db: Session):
+    """
+    Получает клиентов по списку ID одним запросом по первичному ключу.
+    """
+    if not ids:
+        return []
+    clients = db.query(Client).filter(Client.id.in_(ids)).all()
+    return [
+        ClientSchemas.ClientResponse.model_validate(client)
+        for client in clients
+    ]
+
+
+def get_mutual_matches(client_id: int, db: Session):
+    """
+    Получает клиентов, с которыми у клиента взаимная симпатия.
+    """
+    partner_ids = [
+        row.partner_id
+        for row in db.query(MutualMatch.partner_id).filter(
+            MutualMatch.client_id == client_id
+        )
+    ]
+    return _clients_by_ids(partner_ids, db)
+
+
+def get_votes_received(client_id: int, db: Session):
+    """
+    Получает клиентов, которые проголосовали за клиента.
+    """
+    matcher_ids = [
+        row.matcher
+        for row in db.query(Match.matcher)
+        .filter(Match.matched == client_id)
+        .union(
+            db.query(VoteState.matcher).filter(VoteState.matched == client_id)
+        )
+    ]
+    return _clients_by_ids(matcher_ids, db)
+
+
+def get_votes_given(client_id: int, db: Session):
+    """
+    Получает клиентов, за которых проголосовал клиент.
+    """
+    matched_ids = [
+        row.matched
+        for row in db.query(Match.matched)
+        .filter(Match.matcher == client_id)
+        .union(
+            db.query(VoteState.matched).filter(VoteState.matcher == client_id)
+        )
+    ]
+    return _clients_by_ids(matched_ids, db)
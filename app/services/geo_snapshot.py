@@ -0,0 +1,396 @@
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import namedtuple
+from datetime import date
+
+from database import SessionLocal
+from dotenv import load_dotenv
+from models.clients import Client
+from sqlalchemy.orm import Session
+
+load_dotenv()
+
+
+GEO_SNAPSHOT_PATH = os.getenv("GEO_SNAPSHOT_PATH", "geo_snapshot.bin")
+GEO_DELTA_LOG_PATH = os.getenv("GEO_DELTA_LOG_PATH", "geo_snapshot.log")
+GEO_DELTA_LOG_MAX_SIZE = int(os.getenv("GEO_DELTA_LOG_MAX_SIZE", 16 << 20))
+
+MAGIC = b"GEOSNAP1"
+# magic, количество строк, смещение и inode журнала, длина словаря полов
+HEADER = struct.Struct("<8sQQQI")
+# Радиус Земли, как в `great_circle_distance`.
+EARTH_RADIUS_KM = 6371.0
+# Запас к границам квадрата на погрешность вычислений с плавающей точкой.
+BOX_MARGIN_DEGREES = 1e-9
+
+Candidate = namedtuple("Candidate", ["id", "latitude", "longitude"])
+
+
+def _align(offset: int):
+    return (offset + 7) & ~7
+
+
+def bounding_box(latitude: float, longitude: float, distance: float):
+    """
+    Границы сферической «шапки» радиусом `distance` км вокруг точки.
+
+    Возвращает (мин. широта, макс. широта, полуширина по долготе) в
+    градусах; полуширина None, если шапка накрывает полюс и долготу
+    проверять нельзя. Возвращает None, если квадрат построить нельзя
+    (некорректные координаты или круг больше полушария).
+    """
+    radius = distance / EARTH_RADIUS_KM
+    if not (
+        math.isfinite(latitude)
+        and math.isfinite(longitude)
+        and 0 <= radius < math.pi / 2
+        and -90.0 <= latitude <= 90.0
+    ):
+        return None
+    phi = math.radians(latitude)
+    min_phi = phi - radius
+    max_phi = phi + radius
+    margin = BOX_MARGIN_DEGREES
+    if max_phi >= math.pi / 2 or min_phi <= -math.pi / 2:
+        return (
+            max(math.degrees(min_phi), -90.0) - margin,
+            min(math.degrees(max_phi), 90.0) + margin,
+            None,
+        )
+    lon_delta = math.asin(min(math.sin(radius) / math.cos(phi), 1.0))
+    return (
+        math.degrees(min_phi) - margin,
+        math.degrees(max_phi) + margin,
+        math.degrees(lon_delta) + margin,
+    )
+
+
+def build_snapshot(
+    db: Session,
+    path: str = GEO_SNAPSHOT_PATH,
+    log_path: str = GEO_DELTA_LOG_PATH,
+    log_max_size: int = GEO_DELTA_LOG_MAX_SIZE,
+):
+    """
+    Строит снимок координат клиентов и атомарно заменяет им старый.
+
+    Снимок - файл с колонками `id`, `latitude`, `longitude`,
+    `registration_date` и `sex`, упакованными в массивы фиксированной
+    ширины. В заголовке запоминается позиция в журнале изменений, с
+    которой воркерам нужно его дочитывать: журнал фиксируется до чтения
+    базы, поэтому изменения, сделанные во время сборки, не теряются
+    (повторное применение записи журнала ничего не портит).
+    Возвращает количество строк в снимке.
+    """
+    if os.path.exists(log_path) and os.path.getsize(log_path) > log_max_size:
+        os.replace(log_path, f"{log_path}.1")
+    open(log_path, "ab").close()
+    log_stat = os.stat(log_path)
+    ids, latitudes, longitudes = array("q"), array("d"), array("d")
+    dates, sexes = array("i"), array("B")
+    sex_codes = {}
+    rows = (
+        db.query(
+            Client.id,
+            Client.latitude,
+            Client.longitude,
+            Client.sex,
+            Client.registration_date,
+        )
+        .order_by(Client.id)
+        .yield_per(1000)
+    )
+    for row in rows:
+        ids.append(row.id)
+        latitudes.append(math.nan if row.latitude is None else row.latitude)
+        longitudes.append(
+            math.nan if row.longitude is None else row.longitude
+        )
+        dates.append(
+            row.registration_date.toordinal() if row.registration_date else 0
+        )
+        sexes.append(sex_codes.setdefault(row.sex, len(sex_codes) + 1))
+    vocabulary = json.dumps(list(sex_codes)).encode()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as snapshot:
+        snapshot.write(
+            HEADER.pack(
+                MAGIC,
+                len(ids),
+                log_stat.st_size,
+                log_stat.st_ino,
+                len(vocabulary),
+            )
+        )
+        snapshot.write(vocabulary)
+        for column in (ids, latitudes, longitudes, dates, sexes):
+            snapshot.write(b"\0" * (_align(snapshot.tell()) - snapshot.tell()))
+            column.tofile(snapshot)
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.replace(tmp_path, path)
+    return len(ids)
+
+
+def _append_delta(record: dict, log_path: str = GEO_DELTA_LOG_PATH):
+    """
+    Дописывает изменение в журнал одной атомарной записью O_APPEND.
+
+    Если журнала нет (снимок ни разу не строился), ничего не делает.
+    """
+    try:
+        fd = os.open(log_path, os.O_WRONLY | os.O_APPEND)
+    except FileNotFoundError:
+        return
+    try:
+        os.write(fd, json.dumps(record).encode() + b"\n")
+    finally:
+        os.close(fd)
+
+
+def record_upsert(
+    id: int,
+    latitude: float,
+    longitude: float,
+    sex: str,
+    registration_date: date,
+):
+    """
+    Записывает в журнал новые координаты и атрибуты клиента.
+    """
+    _append_delta(
+        {
+            "op": "upsert",
+            "id": id,
+            "latitude": latitude,
+            "longitude": longitude,
+            "sex": sex,
+            "date": (
+                registration_date.toordinal() if registration_date else 0
+            ),
+        }
+    )
+
+
+def record_delete(id: int):
+    """
+    Записывает в журнал удаление клиента.
+    """
+    _append_delta({"op": "delete", "id": id})
+
+
+class GeoSnapshot:
+    """
+    Отображённый в память снимок координат клиентов.
+
+    Колонки читаются прямо из `mmap` через `memoryview` без копирования,
+    поэтому все воркеры на одном хосте делят одни и те же страницы.
+    Изменения после сборки снимка берутся из журнала и хранятся в
+    небольшом словаре `overlay` (`None` - клиент удалён).
+    """
+
+    def __init__(
+        self,
+        path: str = GEO_SNAPSHOT_PATH,
+        log_path: str = GEO_DELTA_LOG_PATH,
+    ):
+        self.path = path
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._stat = None
+        self._columns = None
+        self._sex_codes = {}
+        self._overlay = {}
+        self._log = None
+        self._log_buffer = b""
+
+    def _load(self, stat):
+        with open(self.path, "rb") as snapshot:
+            mapped = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, log_offset, log_inode, vocabulary_size = (
+            HEADER.unpack_from(mapped)
+        )
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} не является снимком координат")
+        offset = HEADER.size
+        vocabulary = json.loads(mapped[offset:offset + vocabulary_size])
+        offset += vocabulary_size
+        view = memoryview(mapped)
+        columns = []
+        for code, size in (("q", 8), ("d", 8), ("d", 8), ("i", 4), ("B", 1)):
+            offset = _align(offset)
+            columns.append(view[offset:offset + count * size].cast(code))
+            offset += count * size
+        self._columns = columns
+        self._sex_codes = {
+            sex: code for code, sex in enumerate(vocabulary, start=1)
+        }
+        self._overlay = {}
+        self._open_log(log_offset, log_inode)
+        self._stat = (stat.st_ino, stat.st_mtime_ns)
+
+    def _open_log(self, offset: int, inode: int = None):
+        if self._log:
+            self._log.close()
+        self._log_buffer = b""
+        try:
+            self._log = open(self.log_path, "rb")
+        except FileNotFoundError:
+            self._log = None
+            return
+        if inode is None or os.fstat(self._log.fileno()).st_ino == inode:
+            self._log.seek(offset)
+
+    def _read_log(self):
+        if self._log is None:
+            self._open_log(0)
+            if self._log is None:
+                return
+        while True:
+            self._log_buffer += self._log.read()
+            *lines, self._log_buffer = self._log_buffer.split(b"\n")
+            if lines:
+                # Словарь заменяется целиком, а не меняется на месте:
+                # запросы обходят полученную ссылку без блокировки.
+                overlay = dict(self._overlay)
+                for line in lines:
+                    record = json.loads(line)
+                    if record["op"] == "delete":
+                        overlay[record["id"]] = None
+                    else:
+                        overlay[record["id"]] = record
+                self._overlay = overlay
+            try:
+                rotated = (
+                    os.stat(self.log_path).st_ino
+                    != os.fstat(self._log.fileno()).st_ino
+                )
+            except FileNotFoundError:
+                return
+            if not rotated:
+                return
+            # Журнал заменён сборщиком: старый файл дочитан, переходим
+            # к новому с начала.
+            self._open_log(0)
+
+    def refresh(self):
+        """
+        Перечитывает снимок, если он был пересобран, и дочитывает журнал.
+
+        Возвращает False, если снимок недоступен.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._columns = None
+            return False
+        if self._stat != (stat.st_ino, stat.st_mtime_ns):
+            self._load(stat)
+        self._read_log()
+        return True
+
+    def candidates(
+        self,
+        latitude: float,
+        longitude: float,
+        distance: int,
+        sex: str = None,
+        start_date: date = None,
+        end_date: date = None,
+    ):
+        """
+        Возвращает клиентов, попадающих в квадрат вокруг точки.
+
+        Квадрат описан вокруг сферического круга поиска (см.
+        `bounding_box`), поэтому точное расстояние проверяет вызывающий
+        код. Фильтры по полу и дате регистрации только сужают выборку:
+        итоговый запрос к базе всё равно их применяет. Если снимок
+        недоступен или квадрат построить нельзя, возвращает None.
+        """
+        box = bounding_box(latitude, longitude, distance)
+        if box is None:
+            return None
+        min_lat, max_lat, lon_delta = box
+        with self._lock:
+            if not self.refresh():
+                return None
+            ids, latitudes, longitudes, dates, sexes = self._columns
+            overlay = self._overlay
+            sex_code = self._sex_codes.get(sex, -1) if sex else None
+        start = start_date.toordinal() if start_date else 0
+        end = end_date.toordinal() if end_date else 0
+
+        def in_box(row_lat, row_lon, row_date):
+            if not min_lat <= row_lat <= max_lat:
+                return False
+            if lon_delta is not None and not (
+                abs((row_lon - longitude + 180.0) % 360.0 - 180.0)
+                <= lon_delta
+            ):
+                return False
+            if row_date and (
+                (start and row_date < start) or (end and row_date > end)
+            ):
+                return False
+            return True
+
+        result = [
+            Candidate(ids[i], latitudes[i], longitudes[i])
+            for i in range(len(ids))
+            if (sex_code is None or sexes[i] == sex_code)
+            and ids[i] not in overlay
+            and in_box(latitudes[i], longitudes[i], dates[i])
+        ]
+        for id, record in overlay.items():
+            if (
+                record is not None
+                and record["latitude"] is not None
+                and record["longitude"] is not None
+                and (sex is None or record["sex"] == sex)
+                and in_box(
+                    record["latitude"], record["longitude"], record["date"]
+                )
+            ):
+                result.append(
+                    Candidate(id, record["latitude"], record["longitude"])
+                )
+        return result
+
+
+geo_snapshot = GeoSnapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Сборка общего снимка координат клиентов."
+    )
+    parser.add_argument("--path", default=GEO_SNAPSHOT_PATH)
+    parser.add_argument("--log-path", default=GEO_DELTA_LOG_PATH)
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=0,
+        help="Пересобирать снимок каждые N секунд (0 - собрать один раз).",
+    )
+    args = parser.parse_args()
+    while True:
+        db = SessionLocal()
+        try:
+            count = build_snapshot(db, args.path, args.log_path)
+        finally:
+            db.close()
+        print(f"Снимок координат собран: {count} клиентов")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
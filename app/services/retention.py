@@ -0,0 +1,165 @@
+import argparse
+import gzip
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+
+from database import SessionLocal
+from dotenv import load_dotenv
+from models.clients import Match, RefreshToken, VoteDailyCount, VoteState
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+load_dotenv()
+
+
+MATCHES_RETENTION_DAYS = int(os.getenv("MATCHES_RETENTION_DAYS", 7))
+MATCHES_ARCHIVE_DIR = os.getenv("MATCHES_ARCHIVE_DIR", "archive")
+MATCHES_BATCH_SIZE = int(os.getenv("MATCHES_BATCH_SIZE", 1000))
+
+
+def archive_rows(rows: list, archive_path: str):
+    """
+    Дописывает строки голосов в сжатый NDJSON файл архива.
+    """
+    with gzip.open(archive_path, "at", encoding="utf-8") as archive:
+        for row in rows:
+            archive.write(
+                json.dumps(
+                    {
+                        "id": row.id,
+                        "matcher": row.matcher,
+                        "matched": row.matched,
+                        "date": row.date.isoformat() if row.date else None,
+                    }
+                )
+                + "\n"
+            )
+
+
+def compact_votes(rows: list, db: Session):
+    """
+    Переносит голоса в таблицу состояний пар, если пары там ещё нет.
+    """
+    pairs = {}
+    for row in rows:
+        pairs.setdefault((row.matcher, row.matched), row.date)
+    existing = {
+        (state.matcher, state.matched)
+        for state in db.query(VoteState.matcher, VoteState.matched).filter(
+            tuple_(VoteState.matcher, VoteState.matched).in_(list(pairs))
+        )
+    }
+    db.add_all(
+        VoteState(matcher=matcher, matched=matched, date=vote_date)
+        for (matcher, matched), vote_date in pairs.items()
+        if (matcher, matched) not in existing
+    )
+
+
+def summarize_votes(rows: list, db: Session):
+    """
+    Прибавляет голоса к сводке количества голосов клиента за день.
+    """
+    counts = {}
+    for row in rows:
+        key = (row.matcher, row.date)
+        counts[key] = counts.get(key, 0) + 1
+    existing = {
+        (summary.matcher, summary.date): summary
+        for summary in db.query(VoteDailyCount).filter(
+            tuple_(VoteDailyCount.matcher, VoteDailyCount.date).in_(
+                list(counts)
+            )
+        )
+    }
+    for (matcher, vote_date), count in counts.items():
+        summary = existing.get((matcher, vote_date))
+        if summary:
+            summary.count += count
+        else:
+            db.add(VoteDailyCount(matcher=matcher, date=vote_date, count=count))
+
+
+def compact_matches(
+    db: Session,
+    retention_days: int = MATCHES_RETENTION_DAYS,
+    archive_dir: str = MATCHES_ARCHIVE_DIR,
+    batch_size: int = MATCHES_BATCH_SIZE,
+):
+    """
+    Сжимает устаревшие голоса из таблицы `matches`.
+
+    Голоса старше `retention_days` дней пачками по `batch_size` строк
+    архивируются в NDJSON (gzip), переносятся в `vote_states` и
+    `vote_daily_counts` и удаляются. Каждая пачка - отдельная транзакция.
+    Возвращает количество обработанных строк.
+    """
+    cutoff = date.today() - timedelta(days=max(retention_days, 1))
+    os.makedirs(archive_dir, exist_ok=True)
+    archive_path = os.path.join(
+        archive_dir,
+        f"matches-{datetime.now().strftime('%Y%m%d-%H%M%S')}.ndjson.gz",
+    )
+    total = 0
+    while True:
+        rows = (
+            db.query(Match)
+            .filter(Match.date < cutoff)
+            .order_by(Match.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            break
+        archive_rows(rows, archive_path)
+        compact_votes(rows, db)
+        summarize_votes(rows, db)
+        db.query(Match).filter(
+            Match.id.in_([row.id for row in rows])
+        ).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+        total += len(rows)
+    return total
+
+
+def purge_refresh_tokens(db: Session):
+    """
+    Удаляет refresh токены с истёкшим сроком действия.
+
+    Срок действия хранится в UTC.
+    """
+    total = (
+        db.query(RefreshToken)
+        .filter(RefreshToken.expires_at < datetime.now(timezone.utc))
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Очистка и сжатие таблицы голосов `matches`."
+    )
+    parser.add_argument(
+        "--retention-days", type=int, default=MATCHES_RETENTION_DAYS
+    )
+    parser.add_argument("--archive-dir", default=MATCHES_ARCHIVE_DIR)
+    parser.add_argument("--batch-size", type=int, default=MATCHES_BATCH_SIZE)
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        total = compact_matches(
+            db, args.retention_days, args.archive_dir, args.batch_size
+        )
+        tokens = purge_refresh_tokens(db)
+    finally:
+        db.close()
+    print(f"Обработано голосов: {total}")
+    print(f"Удалено refresh токенов: {tokens}")
+
+
+if __name__ == "__main__":
+    main()
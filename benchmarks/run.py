@@ -0,0 +1,360 @@
+"""
+Микробенчмарки горячих функций `services/client.py` и `auth/auth.py`.
+
+Запуск из корня репозитория:
+    python benchmarks/run.py                    # замер и сравнение с базой
+    python benchmarks/run.py --save-baseline    # сохранить замер как базу
+
+Данные создаются в SQLite в памяти. Результаты сохраняются в JSON вместе
+с описанием окружения; если лучшее время какого-либо замера хуже базового
+больше чем на `--threshold`, скрипт завершается с кодом 1.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "app")
+sys.path.insert(0, APP_DIR)
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+os.environ.setdefault("LIMIT_PER_DAY", "5")
+
+import pydantic  # noqa: E402
+import sqlalchemy  # noqa: E402
+from auth.auth import create_access_token, get_current_user  # noqa: E402
+from database import Base  # noqa: E402
+from models.clients import Client, Match  # noqa: E402
+from PIL import Image  # noqa: E402
+from services import client as ClientService  # noqa: E402
+from services.geo_snapshot import (GEO_SNAPSHOT_PATH,  # noqa: E402
+                                   build_snapshot)
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session, sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+DEFAULT_SIZES = [100, 1000, 10000]
+IMAGE_SIZES = [256, 1024, 2048]
+CENTER = (55.75, 37.62)
+FILTERS = {
+    "no_filters": {},
+    "sex": {"sex": "female"},
+    "name": {"name": "an"},
+    "dates": {
+        "start_date": date(2024, 3, 1),
+        "end_date": date(2024, 9, 1),
+    },
+    "sort": {"sort_by": "registration_date"},
+    "distance": {"distance": 50},
+    "all": {
+        "sex": "female",
+        "name": "an",
+        "start_date": date(2024, 3, 1),
+        "end_date": date(2024, 9, 1),
+        "sort_by": "registration_date",
+        "distance": 50,
+    },
+}
+NAMES = ["Anna", "Ivan", "Maria", "Oleg", "Elena", "Dmitry", "Diana", "Pavel"]
+
+
+def measure(func, min_time: float = 0.2, rounds: int = 7):
+    """
+    Замеряет время одного вызова `func` в микросекундах.
+
+    Число вызовов в раунде подбирается так, чтобы раунд длился не меньше
+    `min_time` секунд. Возвращает медиану и минимум по раундам; с базой
+    сравнивается минимум, он меньше всего зависит от фонового шума.
+    """
+    func()
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / elapsed * 1.1))
+    timings = [elapsed / number]
+    for _ in range(rounds - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return {
+        "median_us": statistics.median(timings) * 1e6,
+        "min_us": min(timings) * 1e6,
+        "calls": number * rounds,
+    }
+
+
+def make_database(size: int):
+    """
+    Создаёт SQLite в памяти с `size` случайными клиентами.
+    """
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(size)
+    db = sessionmaker(bind=engine)()
+    db.add_all(
+        Client(
+            mail=f"client{i}@example.com",
+            hashed_password="",
+            name=rng.choice(NAMES),
+            last_name=rng.choice(NAMES) + "ov",
+            sex=rng.choice(["male", "female"]),
+            latitude=CENTER[0] + rng.uniform(-3, 3),
+            longitude=CENTER[1] + rng.uniform(-3, 3),
+            registration_date=date(2024, 1, 1)
+            + timedelta(days=rng.randrange(365)),
+        )
+        for i in range(size)
+    )
+    db.commit()
+    return engine, db
+
+
+def bench_get_all_clients(sizes: list):
+    """
+    Поиск по расстоянию замеряется дважды: по базе и по снимку координат.
+    """
+    results = {}
+    for size in sizes:
+        engine, db = make_database(size)
+        for name, filters in FILTERS.items():
+            kwargs = dict(filters)
+            if "distance" in kwargs:
+                kwargs["latitude"], kwargs["longitude"] = CENTER
+            results[f"get_all_clients[{name}-{size}]"] = measure(
+                lambda: ClientService.get_all_clients(db, **kwargs)
+            )
+            if "distance" in kwargs:
+                build_snapshot(db)
+                try:
+                    results[
+                        f"get_all_clients[{name}+snapshot-{size}]"
+                    ] = measure(
+                        lambda: ClientService.get_all_clients(db, **kwargs)
+                    )
+                finally:
+                    os.remove(GEO_SNAPSHOT_PATH)
+        db.close()
+        engine.dispose()
+    return results
+
+
+def bench_great_circle_distance():
+    distance = ClientService.great_circle_distance
+    rng = random.Random(0)
+    points = [
+        (rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(50000)
+    ]
+    state = {"index": 0}
+
+    def miss():
+        state["index"] = (state["index"] + 1) % len(points)
+        distance(*CENTER, *points[state["index"]])
+
+    def hit():
+        distance(*CENTER, *points[0])
+
+    distance.cache_clear()
+    results = {"great_circle_distance[miss]": measure(miss)}
+    distance.cache_clear()
+    results["great_circle_distance[hit]"] = measure(hit)
+    info = distance.cache_info()
+    results["great_circle_distance[hit]"]["hit_rate"] = info.hits / (
+        info.hits + info.misses
+    )
+    return results
+
+
+def bench_matching():
+    engine, db = make_database(100)
+    db.close()
+    limit = ClientService.LIMIT_PER_DAY
+    connection = engine.connect()
+
+    def run(matcher_id: int, matched_id: int, votes_today: int, mutual: bool):
+        """
+        Выполняет `matching` в транзакции, которая затем откатывается.
+        """
+        transaction = connection.begin()
+        db = Session(bind=connection, join_transaction_mode="create_savepoint")
+        try:
+            db.add_all(
+                Match(matcher=matcher_id, matched=50 + i, date=date.today())
+                for i in range(votes_today)
+            )
+            if mutual:
+                db.add(Match(matcher=matched_id, matched=matcher_id))
+            db.flush()
+            ClientService.matching(matcher_id, matched_id, db)
+        finally:
+            db.close()
+            transaction.rollback()
+
+    cases = {
+        "matching[limit_reached]": (1, 2, limit, False),
+        "matching[near_limit]": (1, 2, limit - 1, False),
+        "matching[mutual]": (1, 2, 0, True),
+    }
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, args in cases.items():
+            results[name] = measure(lambda: run(*args))
+    connection.close()
+    engine.dispose()
+    return results
+
+
+def bench_add_watermark(workdir: str):
+    watermark = os.path.join(APP_DIR, "static", "watermark.png")
+    results = {}
+    for size in IMAGE_SIZES:
+        path = os.path.join(workdir, f"avatar-{size}.jpg")
+        Image.new("RGB", (size, size), (120, 80, 200)).save(path, "JPEG")
+        results[f"add_watermark[{size}px]"] = measure(
+            lambda: ClientService.add_watermark(path, watermark), rounds=3
+        )
+    return results
+
+
+def bench_tokens():
+    loop = asyncio.new_event_loop()
+    token = create_access_token(
+        "client@example.com", 1, timedelta(minutes=20)
+    )
+    results = {
+        "create_access_token": measure(
+            lambda: create_access_token(
+                "client@example.com", 1, timedelta(minutes=20)
+            )
+        ),
+        "get_current_user": measure(
+            lambda: loop.run_until_complete(get_current_user(token))
+        ),
+    }
+    loop.close()
+    return results
+
+
+def environment():
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "sqlite": sqlite3.sqlite_version,
+        "sqlalchemy": sqlalchemy.__version__,
+        "pydantic": pydantic.__version__,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    """
+    Печатает сравнение с базой и возвращает список регрессий.
+    """
+    regressions = []
+    print(f"{'benchmark':<48}{'base, us':>12}{'now, us':>12}{'change':>9}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<48}{'-':>12}{current['min_us']:>12.1f}")
+            continue
+        change = current["min_us"] / base["min_us"] - 1
+        mark = ""
+        if change > threshold:
+            regressions.append(name)
+            mark = "  <- регрессия"
+        print(
+            f"{name:<48}{base['min_us']:>12.1f}"
+            f"{current['min_us']:>12.1f}{change:>+9.1%}{mark}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Микробенчмарки сервисного слоя."
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--only", help="Запускать замеры с этой подстрокой.")
+    parser.add_argument("--output", help="Куда сохранить результаты (JSON).")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Допустимое ухудшение лучшего времени (0.2 = 20%%).",
+    )
+    args = parser.parse_args()
+
+    # Снимок координат и его журнал создаются в текущем каталоге.
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="benchmarks-")
+    os.chdir(workdir)
+    suites = {
+        "get_all_clients": lambda: bench_get_all_clients(args.sizes),
+        "great_circle_distance": bench_great_circle_distance,
+        "matching": bench_matching,
+        "add_watermark": lambda: bench_add_watermark(workdir),
+        "tokens": bench_tokens,
+    }
+    results = {}
+    try:
+        for name, suite in suites.items():
+            if args.only and args.only not in name:
+                continue
+            print(f"Замер {name}...", file=sys.stderr)
+            results.update(suite())
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"environment": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+    if args.save_baseline:
+        with open(args.baseline, "w") as output:
+            json.dump(report, output, indent=2, ensure_ascii=False)
+        print(f"База сохранена в {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        compare(results, {}, args.threshold)
+        print("База не найдена, сравнение пропущено (--save-baseline).")
+        return
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline["environment"]["machine"] != report["environment"]["machine"]:
+        print("Внимание: база снята на другой архитектуре.")
+    regressions = compare(results, baseline["results"], args.threshold)
+    if regressions:
+        print(f"Регрессии больше {args.threshold:.0%}: {len(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
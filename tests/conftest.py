@@ -0,0 +1,7 @@
+import os
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "app")
+sys.path.insert(0, os.path.abspath(APP_DIR))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("LIMIT_PER_DAY", "5")
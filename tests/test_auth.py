@@ -0,0 +1,261 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from auth import auth as Auth
+from auth.throttling import TokenBucketLimiter
+from database import Base, get_db
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from jose import jwt
+from models.clients import Client
+from routers import client as ClientRouter
+from services import client as ClientService
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+PASSWORD = "secret"
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def api(db, tmp_path, monkeypatch):
+    # Приложение собирается из роутеров: main при импорте создаёт базу
+    # sql_app.db и требует каталог static.
+    monkeypatch.chdir(tmp_path)
+    for name in ("login_ip_limiter", "login_mail_limiter",
+                 "login_mail_ip_limiter"):
+        monkeypatch.setattr(Auth, name, TokenBucketLimiter(100, 0))
+    app = FastAPI()
+    app.include_router(Auth.router, prefix="/auth")
+    app.include_router(ClientRouter.router, prefix="/api")
+    app.dependency_overrides[get_db] = lambda: db
+    return TestClient(ClientAddress(app))
+
+
+class ClientAddress:
+    """
+    Подставляет адрес клиента из заголовка `X-Client-IP`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = dict(scope["headers"])
+            if b"x-client-ip" in headers:
+                ip = headers[b"x-client-ip"].decode()
+                scope = dict(scope, client=(ip, 0))
+        await self.app(scope, receive, send)
+
+
+def add_client(db, mail: str):
+    client = Client(
+        mail=mail,
+        hashed_password=ClientService.bcrypt_context.hash(PASSWORD),
+        sex="male",
+    )
+    db.add(client)
+    db.commit()
+    return client.id
+
+
+def try_login(api, mail: str, password: str, ip: str = "10.0.0.1"):
+    return api.post(
+        "/auth/token",
+        data={"username": mail, "password": password},
+        headers={"X-Client-IP": ip},
+    )
+
+
+def login(api, mail: str, password: str = PASSWORD):
+    response = try_login(api, mail, password)
+    assert response.status_code == 200
+    return response.json()
+
+
+def refresh(api, tokens: dict):
+    return api.post(
+        "/auth/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+
+
+def bearer(tokens: dict):
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+def test_refresh_rotates_token(api, db):
+    add_client(db, "a@example.com")
+    tokens = login(api, "a@example.com")
+    response = refresh(api, tokens)
+    assert response.status_code == 200
+    rotated = response.json()
+    assert rotated["refresh_token"] != tokens["refresh_token"]
+    matches = api.get("/api/clients/me/matches", headers=bearer(rotated))
+    assert matches.status_code == 200
+    assert refresh(api, rotated).status_code == 200
+
+
+def test_reused_refresh_token_revokes_family(api, db):
+    add_client(db, "a@example.com")
+    tokens = login(api, "a@example.com")
+    rotated = refresh(api, tokens).json()
+    other = login(api, "a@example.com")
+    assert refresh(api, tokens).status_code == 401
+    assert refresh(api, rotated).status_code == 401
+    # Другой вход того же клиента - отдельное семейство.
+    assert refresh(api, other).status_code == 200
+
+
+def test_revoke_endpoint(api, db):
+    add_client(db, "a@example.com")
+    tokens = login(api, "a@example.com")
+    api.post("/auth/revoke", json={"refresh_token": tokens["refresh_token"]})
+    assert refresh(api, tokens).status_code == 401
+
+
+def test_password_change_revokes_refresh_tokens(api, db):
+    id = add_client(db, "a@example.com")
+    tokens = login(api, "a@example.com")
+    response = api.patch(
+        f"/api/clients/{id}",
+        json={"password": "new"},
+        headers=bearer(tokens),
+    )
+    assert response.status_code == 200
+    assert refresh(api, tokens).status_code == 401
+    tokens = login(api, "a@example.com", "new")
+    assert refresh(api, tokens).status_code == 200
+
+
+def test_refresh_uses_current_mail(api, db):
+    id = add_client(db, "a@example.com")
+    tokens = login(api, "a@example.com")
+    api.patch(
+        f"/api/clients/{id}",
+        json={"mail": "b@example.com"},
+        headers=bearer(tokens),
+    )
+    access_token = refresh(api, tokens).json()["access_token"]
+    assert jwt.get_unverified_claims(access_token)["sub"] == "b@example.com"
+
+
+def test_delete_revokes_tokens_and_id_is_not_reused(api, db):
+    add_client(db, "a@example.com")
+    id = add_client(db, "b@example.com")
+    tokens = login(api, "b@example.com")
+    etag = api.get(f"/api/clients/{id}", headers=bearer(tokens)).headers[
+        "etag"
+    ]
+    assert api.delete(
+        f"/api/clients/{id}", headers=bearer(tokens)
+    ).status_code == 200
+    assert add_client(db, "c@example.com") != id
+    assert refresh(api, tokens).status_code == 401
+    assert api.get(
+        f"/api/clients/{id}",
+        headers={**bearer(tokens), "If-None-Match": etag},
+    ).status_code == 404
+    assert api.patch(
+        f"/api/clients/{id}", json={"name": "x"}, headers=bearer(tokens)
+    ).status_code == 404
+
+
+@pytest.mark.parametrize("zone", ["America/New_York", "Asia/Tokyo"])
+def test_token_lifetime_does_not_depend_on_timezone(
+    api, db, monkeypatch, zone
+):
+    monkeypatch.setenv("TZ", zone)
+    time.tzset()
+    try:
+        add_client(db, "a@example.com")
+        tokens = login(api, "a@example.com")
+        assert api.get(
+            "/api/clients/me/matches", headers=bearer(tokens)
+        ).status_code == 200
+        now = time.time()
+        access = jwt.get_unverified_claims(tokens["access_token"])
+        assert abs(
+            access["exp"] - now - Auth.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        ) < 60
+        refresh_claims = jwt.get_unverified_claims(tokens["refresh_token"])
+        assert abs(
+            refresh_claims["exp"] - now
+            - Auth.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+        ) < 60
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_failed_logins_are_limited_per_mail_across_ips(api, db, monkeypatch):
+    monkeypatch.setattr(Auth, "login_mail_limiter", TokenBucketLimiter(3, 0))
+    add_client(db, "a@example.com")
+    statuses = [
+        try_login(api, "a@example.com", "wrong", f"10.0.0.{i}").status_code
+        for i in range(6)
+    ]
+    assert statuses == [401] * 3 + [429] * 3
+
+
+def test_failed_logins_are_limited_per_mail_and_ip(api, db, monkeypatch):
+    monkeypatch.setattr(
+        Auth, "login_mail_ip_limiter", TokenBucketLimiter(2, 0)
+    )
+    add_client(db, "a@example.com")
+    statuses = [
+        try_login(api, "a@example.com", "wrong").status_code
+        for _ in range(3)
+    ]
+    assert statuses == [401, 401, 429]
+    # Владелец с другого адреса входит: ошибки с первого на него не влияют.
+    assert try_login(
+        api, "a@example.com", PASSWORD, "10.0.0.2"
+    ).status_code == 200
+
+
+def test_successful_logins_are_not_charged(api, db, monkeypatch):
+    monkeypatch.setattr(Auth, "login_mail_limiter", TokenBucketLimiter(1, 0))
+    monkeypatch.setattr(
+        Auth, "login_mail_ip_limiter", TokenBucketLimiter(1, 0)
+    )
+    add_client(db, "a@example.com")
+    for _ in range(3):
+        login(api, "a@example.com")
+
+
+def test_parallel_failures_are_reserved_before_password_check(
+    api, monkeypatch
+):
+    monkeypatch.setattr(
+        Auth, "login_mail_ip_limiter", TokenBucketLimiter(5, 0)
+    )
+
+    def slow_failure(mail, password, db):
+        time.sleep(0.3)
+        return False
+
+    monkeypatch.setattr(Auth, "authenticate_user", slow_failure)
+    with ThreadPoolExecutor(20) as executor:
+        statuses = list(
+            executor.map(
+                lambda _: try_login(api, "a@example.com", "wrong").status_code,
+                range(20),
+            )
+        )
+    assert sorted(statuses) == [401] * 5 + [429] * 15
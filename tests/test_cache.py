@@ -0,0 +1,61 @@
+import json
+import math
+import random
+
+import pytest
+from database import Base
+from models.clients import Client
+from services import client as ClientService
+from services.cache import (LOCATION_CELL_FRACTION, ResponseCache,
+                            location_cell)
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(
+        ClientService, "clients_cache", ResponseCache(256, 30, 1 << 20)
+    )
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.mark.parametrize("distance", [1, 5, 50, 1000])
+def test_location_cell_shift_is_bounded_by_radius(distance):
+    rng = random.Random(distance)
+    for _ in range(1000):
+        latitude, longitude = rng.uniform(-80, 80), rng.uniform(-180, 180)
+        cell = location_cell(latitude, longitude, distance)
+        shift = ClientService.great_circle_distance(
+            latitude, longitude, *cell
+        )
+        assert shift <= distance * LOCATION_CELL_FRACTION * math.sqrt(2) / 2
+
+
+def test_location_cell_keeps_point_for_zero_distance():
+    assert location_cell(55.123456789, 37.5, 0) == (55.123456789, 37.5)
+
+
+def test_small_radius_search_keeps_nearby_client(db):
+    # Точка поиска у края ячейки 0.01°: при прежней сетке клиент в 0.89 км
+    # оказывался в 1.47 км от центра ячейки и выпадал из радиуса 1 км.
+    latitude, longitude = 55.7500001, 37.6100001
+    db.add(Client(mail="near", sex="male", latitude=55.742, longitude=37.61))
+    db.commit()
+    assert ClientService.great_circle_distance(
+        latitude, longitude, 55.742, 37.61
+    ) < 0.9
+    content, _ = ClientService.get_all_clients_json(
+        db, distance=1, latitude=latitude, longitude=longitude
+    )
+    assert [client["mail"] for client in json.loads(content)] == ["near"]
@@ -0,0 +1,203 @@
+import io
+import os
+import random
+
+import pytest
+from database import Base
+from fastapi import BackgroundTasks, UploadFile
+from models.clients import Client
+from schemas import client as ClientSchemas
+from services import client as ClientService
+from services.geo_snapshot import GeoSnapshot, build_snapshot
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+LATITUDES = [-89.5, -75, -45, 0, 30, 60, 70, 80, 89.9]
+DISTANCES = [10, 500, 1500, 2200, 5000, 9000]
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    rng = random.Random(0)
+    points = [(80, 0), (70, 40), (40, 90), (89, 179), (-85, -179)]
+    points += [
+        (rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(1500)
+    ]
+    session.add_all(
+        Client(
+            mail=f"client{i}@example.com",
+            sex="female" if i % 2 else "male",
+            latitude=latitude,
+            longitude=longitude,
+        )
+        for i, (latitude, longitude) in enumerate(points)
+    )
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def snapshot(db, tmp_path, monkeypatch):
+    path = str(tmp_path / "geo.bin")
+    log_path = str(tmp_path / "geo.log")
+    monkeypatch.setattr(
+        ClientService, "geo_snapshot", GeoSnapshot(path, log_path)
+    )
+    return path, log_path
+
+
+def client_ids(db, **filters):
+    clients = ClientService.get_all_clients(db, **filters)
+    return [client.id for client in clients]
+
+
+@pytest.mark.parametrize("latitude", LATITUDES)
+@pytest.mark.parametrize("distance", DISTANCES)
+@pytest.mark.parametrize("longitude", [0, 179.5])
+def test_snapshot_matches_full_scan(
+    db, snapshot, latitude, longitude, distance
+):
+    filters = dict(distance=distance, latitude=latitude, longitude=longitude)
+    expected = client_ids(db, **filters)
+    build_snapshot(db, *snapshot)
+    assert client_ids(db, **filters) == expected
+    assert client_ids(db, sex="female", **filters) == [
+        id for id in expected if id % 2 == 0
+    ]
+
+
+CENTER = dict(latitude=55.75, longitude=37.62, distance=100)
+
+
+@pytest.fixture
+def live_snapshot(db, tmp_path, monkeypatch):
+    # Журнал изменений пишется по путям по умолчанию относительно
+    # текущего каталога, как у воркеров приложения.
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("static")
+    monkeypatch.setattr(ClientService, "geo_snapshot", GeoSnapshot())
+    build_snapshot(db)
+
+
+def assert_matches_full_scan(db, monkeypatch):
+    candidates = ClientService.geo_snapshot.candidates(**CENTER)
+    assert candidates is not None
+    # Удалённые клиенты не должны оставаться среди кандидатов.
+    existing = {id for (id,) in db.query(Client.id)}
+    assert {candidate.id for candidate in candidates} <= existing
+    for filters in (CENTER, dict(CENTER, sex="female")):
+        with monkeypatch.context() as patch:
+            patch.setattr(
+                ClientService,
+                "geo_snapshot",
+                GeoSnapshot("missing.bin", "missing.log"),
+            )
+            expected = client_ids(db, **filters)
+        assert client_ids(db, **filters) == expected
+
+
+def create(db, mail: str, sex: str, latitude: float, longitude: float):
+    data = ClientSchemas.Client(
+        mail=mail,
+        password="secret",
+        name="name",
+        last_name="last_name",
+        sex=sex,
+        latitude=latitude,
+        longitude=longitude,
+    )
+    picture = UploadFile(io.BytesIO(b"picture"), filename="a.jpg")
+    return ClientService.create_client(
+        data, db, picture, BackgroundTasks()
+    ).id
+
+
+def update(db, id: int, sex: str, latitude: float, longitude: float):
+    data = ClientSchemas.ClientUpdate(
+        mail=f"updated{id}@example.com",
+        password="",
+        name="",
+        last_name="",
+        sex=sex,
+        latitude=latitude,
+        longitude=longitude,
+    )
+    ClientService.update(None, id, data, db, BackgroundTasks())
+
+
+def far_clients(db, count: int):
+    return [
+        client.id
+        for client in db.query(Client).order_by(Client.id)
+        if ClientService.great_circle_distance(
+            CENTER["latitude"],
+            CENTER["longitude"],
+            client.latitude,
+            client.longitude,
+        )
+        > 1000
+    ][:count]
+
+
+def test_delta_log_matches_full_scan(db, live_snapshot, monkeypatch):
+    first, second, third, fourth = far_clients(db, 4)
+    created = create(db, "new@example.com", "female", 55.8, 37.7)
+    assert_matches_full_scan(db, monkeypatch)
+    ClientService.patch_client(
+        first, {"latitude": 55.6, "longitude": 37.5}, db
+    )
+    update(db, second, "female", 55.9, 37.4)
+    assert_matches_full_scan(db, monkeypatch)
+    ClientService.patch_client(
+        created, {"latitude": 10.0, "longitude": 10.0}, db
+    )
+    update(db, second, "male", 55.9, 37.4)
+    ClientService.remove(first, db)
+    assert_matches_full_scan(db, monkeypatch)
+
+    # Пересборка с ротацией журнала: изменения, ещё не прочитанные из
+    # старого журнала, есть в новом снимке, а новые пишутся в новый.
+    update(db, third, "female", 55.7, 37.6)
+    build_snapshot(db, log_max_size=0)
+    assert os.path.exists("geo_snapshot.log.1")
+    assert_matches_full_scan(db, monkeypatch)
+    ClientService.patch_client(
+        fourth, {"latitude": 55.76, "longitude": 37.63}, db
+    )
+    ClientService.remove(third, db)
+    create(db, "newer@example.com", "male", 55.74, 37.61)
+    assert_matches_full_scan(db, monkeypatch)
+
+    # Вторая ротация, пока воркер держит открытым уже повёрнутый журнал.
+    ClientService.remove(fourth, db)
+    build_snapshot(db, log_max_size=0)
+    ClientService.patch_client(
+        created, {"latitude": 55.75, "longitude": 37.62}, db
+    )
+    assert_matches_full_scan(db, monkeypatch)
+
+
+def test_reader_follows_log_rotated_without_rebuild(
+    db, live_snapshot, monkeypatch
+):
+    (first,) = far_clients(db, 1)
+    create(db, "new@example.com", "female", 55.8, 37.7)
+    assert_matches_full_scan(db, monkeypatch)
+    # Журнал заменён до того, как воркер увидел новый снимок: старый
+    # дочитывается до конца, новый читается с начала.
+    os.replace("geo_snapshot.log", "geo_snapshot.log.1")
+    open("geo_snapshot.log", "ab").close()
+    ClientService.patch_client(
+        first, {"latitude": 55.7, "longitude": 37.6}, db
+    )
+    assert_matches_full_scan(db, monkeypatch)